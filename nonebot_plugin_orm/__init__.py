@@ -23,7 +23,13 @@ from nonebot import logger, require, get_driver, get_plugin_by_module_name
 from . import migrate
 from .param import ORMParam
 from .config import Config, plugin_config
-from .utils import LoguruHandler, StreamToLogger, coroutine, get_subclasses
+from .utils import (
+    LoguruHandler,
+    StreamToLogger,
+    coroutine,
+    get_log_level,
+    get_subclasses,
+)
 
 if sys.version_info >= (3, 9):
     from typing import Annotated
@@ -214,9 +220,7 @@ def _init_logger():
     logging.getLogger("alembic").addHandler(handler)
     logging.getLogger("sqlalchemy").addHandler(handler)
 
-    log_level = _driver.config.log_level
-    if isinstance(log_level, str):
-        log_level = logger.level(log_level).no
+    log_level = get_log_level()
 
     echo_log_level = log_level if plugin_config.sqlalchemy_echo else logging.WARNING
 
@@ -54,7 +54,7 @@ def _setup_di(cls: type[Model]) -> None:
     parameters: list[Parameter] = []
 
     annotations: dict[str, Any] = {}
-    for base in reversed(cls.__mro__):
+    for base in cls.__mro__[::-1]:
         annotations.update(get_annotations(base, eval_str=True))
 
     for name, type_annotation in annotations.items():
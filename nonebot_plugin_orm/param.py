@@ -1,17 +1,18 @@
 from __future__ import annotations
 
 import sys
-from itertools import repeat
-from typing import Any, cast
+from typing import Any
+from functools import lru_cache
 from dataclasses import dataclass
 from operator import methodcaller
 from inspect import Parameter, isclass
 
 from pydantic.fields import FieldInfo
 from nonebot.dependencies import Param
+from nonebot.typing import origin_is_union
 from nonebot.params import Depends, DependParam
-from sqlalchemy import Row, Result, ScalarResult, select
 from sqlalchemy.sql.selectable import ExecutableReturnsRows
+from sqlalchemy import Row, Result, Select, ScalarResult, select
 from sqlalchemy.ext.asyncio import AsyncResult, AsyncScalarResult
 
 from .model import Model
@@ -22,10 +23,9 @@ if sys.version_info >= (3, 11):
     from collections.abc import Iterator, Sequence, AsyncIterator
 
     Tuple = tuple
-    Type = type
 else:
+    from typing import Tuple, Iterator, Sequence, AsyncIterator
     from typing_extensions import Annotated, get_args, get_origin
-    from typing import Type, Tuple, Iterator, Sequence, AsyncIterator
 
 __all__ = (
     "SQLDepends",
@@ -38,16 +38,19 @@ PATTERNS = {
         True,
         False,
         methodcaller("partitions"),
+        yield_per=1000,
     ),
     AsyncIterator[Sequence[Tuple[Any, ...]]]: Option(
         True,
         False,
         methodcaller("partitions"),
+        yield_per=1000,
     ),
     AsyncIterator[Sequence[Any]]: Option(
         True,
         True,
         methodcaller("partitions"),
+        yield_per=1000,
     ),
     Iterator[Sequence[Row[Tuple[Any, ...]]]]: Option(
         False,
@@ -114,6 +117,7 @@ PATTERNS = {
         methodcaller("one_or_none"),
     ),
 }
+_PATTERNS = tuple(PATTERNS.items())
 
 
 @dataclass
@@ -132,6 +136,69 @@ def SQLDepends(
     return SQLDependsInner(dependency, use_cache, validate)
 
 
+@lru_cache(None)
+def _patterns_by_origin(origin: type) -> tuple[tuple[Any, Option], ...]:
+    # NOTE: a pattern can only match a generic (or plain) class annotation if its
+    # origin is a subclass of the annotation's origin, keep the order of PATTERNS.
+    patterns = []
+    for pattern, option in _PATTERNS:
+        try:
+            if pattern is Any or issubclass(get_origin(pattern), origin):
+                patterns.append((pattern, option))
+        except TypeError:
+            # NOTE: e.g. non-runtime-checkable protocols, never match
+            continue
+
+    return tuple(patterns)
+
+
+@lru_cache(None)
+def _resolve_pattern(
+    type_annotation: Any,
+) -> tuple[tuple[type[Model], ...] | None, Option]:
+    """Match type annotation against PATTERNS.
+
+    Return the matched models if they are all `Model` subclasses (so that a statement
+    can be generated for them), otherwise `None`, along with the matched option.
+    """
+    origin = get_origin(type_annotation) or type_annotation
+    if (
+        isclass(origin)
+        and origin not in (Any, Annotated)
+        and not origin_is_union(origin)
+    ):
+        patterns = _patterns_by_origin(origin)
+    else:
+        patterns = _PATTERNS
+
+    for pattern, option in patterns:
+        if models := generic_issubclass(pattern, type_annotation):
+            break
+    else:
+        return None, Option()
+
+    if not isinstance(models, tuple):
+        models = (models,)
+
+    if all(isclass(model) and issubclass(model, Model) for model in models):
+        return models, option
+
+    return None, option
+
+
+@lru_cache(maxsize=256)
+def _generate_statement(models: tuple[type[Model], ...]) -> Select:
+    # NOTE: `Model.__signature__` is fixed at class creation,
+    # so the generated statement only depends on `models`.
+    return select(*models).where(
+        *(
+            getattr(model, name) == param.default
+            for model in models
+            for name, param in model.__signature__.parameters.items()
+        )
+    )
+
+
 class ORMParam(DependParam):
     @classmethod
     def _check_param(
@@ -148,29 +215,23 @@ class ORMParam(DependParam):
         if isinstance(param.default, SQLDependsInner):
             depends_inner = param.default
 
-        for pattern, option in PATTERNS.items():
-            if models := generic_issubclass(pattern, type_annotation):
-                break
+        if isclass(type_annotation) and issubclass(type_annotation, Model):
+            # NOTE: fast path for the most common case, same as matching `Any`
+            models, option = (type_annotation,), PATTERNS[Any]
         else:
-            models, option = None, Option()
-
-        if not isinstance(models, tuple):
-            models = (models,)
+            try:
+                hash(type_annotation)
+            except TypeError:
+                # NOTE: type annotation is unhashable
+                models, option = _resolve_pattern.__wrapped__(type_annotation)
+            else:
+                models, option = _resolve_pattern(type_annotation)
 
         if depends_inner is not None:
             statement = depends_inner.dependency
-        elif all(map(isclass, models)) and all(
-            map(issubclass, cast(Tuple[type, ...], models), repeat(Model))
-        ):
-            models = cast(Tuple[Type[Model], ...], models)
+        elif models is not None:
             # NOTE: statement is generated (see below)
-            statement = select(*models).where(
-                *(
-                    getattr(model, name) == param.default
-                    for model in models
-                    for name, param in model.__signature__.parameters.items()
-                )
-            )
+            statement = _generate_statement(models)
         else:
             return
 
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
 import asyncio
-from typing import cast
+from io import StringIO
+from pathlib import Path
+from typing import Any, cast
+from collections.abc import Awaitable
 
 from alembic import context
 from sqlalchemy.util import await_only
@@ -16,6 +19,9 @@ from nonebot_plugin_orm import AlembicConfig, plugin_config
 # 注意: 只有部分数据库支持（例如 SQLite 就不支持）.
 USE_TWOPHASE = False
 
+# 同时连接、提交、回滚或关闭的数据库连接数上限.
+MAX_CONCURRENCY = 10
+
 # Alembic Config 对象, 它提供正在使用的 .ini 文件中的值.
 config = cast(AlembicConfig, context.config)
 
@@ -50,25 +56,28 @@ def run_migrations_offline() -> None:
     for name, engine in engines.items():
         config.print_stdout(f"迁移数据库 {name or '<default>'} 中 ...")
         file_ = f"{name}.sql"
-        with open(file_, "w") as buffer:
-            context.configure(
-                **{
-                    **dict(
-                        url=engine.url,
-                        dialect_opts={"paramstyle": "named"},
-                        output_buffer=buffer,
-                        target_metadata=target_metadatas["name"],
-                        literal_binds=True,
-                    ),
-                    **plugin_config.alembic_context,
-                }
-            )
-            with context.begin_transaction():
-                context.run_migrations(name=name)
-            config.print_stdout(f"将输出写入到 {file_}")
+        # 先写入内存, 完成后一次性写入文件.
+        buffer = StringIO()
+        context.configure(
+            **{
+                **dict(
+                    url=engine.url,
+                    dialect_opts={"paramstyle": "named"},
+                    output_buffer=buffer,
+                    target_metadata=target_metadatas[name],
+                    literal_binds=True,
+                ),
+                **plugin_config.alembic_context,
+            }
+        )
+        with context.begin_transaction():
+            context.run_migrations(name=name)
+        Path(file_).write_text(buffer.getvalue())
+        config.print_stdout(f"将输出写入到 {file_}")
 
 
 def do_run_migrations(conn: Connection, name: str, metadata: MetaData) -> None:
+    config.print_stdout(f"迁移数据库 {name or '<default>'} 中 ...")
     context.configure(
         **{
             **dict(
@@ -93,32 +102,46 @@ async def run_migrations_online() -> None:
 
     conns: dict[str, AsyncConnection] = {}
     txns: dict[str, TwoPhaseTransaction] = {}
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
 
-    try:
-        for name, engine in engines.items():
-            config.print_stdout(f"迁移数据库 {name or '<default>'} 中 ...")
-            conn = conns[name] = await engine.connect()
-            if USE_TWOPHASE:
-                txns[name] = await conn.run_sync(Connection.begin_twophase)
-            else:
-                await conn.begin()
+    async def bounded(aw: Awaitable[Any]) -> Any:
+        async with semaphore:
+            return await aw
 
-            await conn.run_sync(do_run_migrations, name, target_metadatas[name])
+    async def begin(name: str, engine: AsyncEngine) -> None:
+        conn = conns[name] = await engine.connect()
+        if USE_TWOPHASE:
+            txns[name] = await conn.run_sync(Connection.begin_twophase)
+        else:
+            await conn.begin()
+
+    try:
+        # 并发连接所有数据库, 等待全部完成后再抛出异常, 以便关闭已建立的连接.
+        for result in await asyncio.gather(
+            *(bounded(begin(name, engine)) for name, engine in engines.items()),
+            return_exceptions=True,
+        ):
+            if isinstance(result, BaseException):
+                raise result
+
+        # 迁移共享全局的 context, 只能逐个运行.
+        for name in engines:
+            await conns[name].run_sync(do_run_migrations, name, target_metadatas[name])
 
         if USE_TWOPHASE:
             await asyncio.gather(
                 *(
-                    conn.run_sync(lambda _: txns[name].prepare())
+                    bounded(conn.run_sync(lambda _, txn=txns[name]: txn.prepare()))
                     for name, conn in conns.items()
                 )
             )
 
-        await asyncio.gather(*(conn.commit() for conn in conns.values()))
+        await asyncio.gather(*(bounded(conn.commit()) for conn in conns.values()))
     except BaseException:
-        await asyncio.gather(*(conn.rollback() for conn in conns.values()))
+        await asyncio.gather(*(bounded(conn.rollback()) for conn in conns.values()))
         raise
     finally:
-        await asyncio.gather(*(conn.close() for conn in conns.values()))
+        await asyncio.gather(*(bounded(conn.close()) for conn in conns.values()))
 
 
 if context.is_offline_mode():
@@ -1,25 +1,31 @@
 from __future__ import annotations
 
+import os
 import sys
 import json
+import site
 import logging
-from io import StringIO
+import sysconfig
 from pathlib import Path
-from functools import wraps
-from itertools import repeat
+from io import TextIOBase
 from contextlib import suppress
 from operator import methodcaller
+from itertools import chain, repeat
+from functools import wraps, lru_cache
 from typing_extensions import Annotated
 from dataclasses import field, dataclass
-from inspect import Parameter, Signature, isclass
-from collections.abc import Callable, Iterable, Generator
-from typing import TYPE_CHECKING, Any, TypeVar, Coroutine
+from inspect import Parameter, Signature, isclass, isawaitable
+from typing import TYPE_CHECKING, Any, TypeVar, Coroutine, cast
+from collections.abc import Mapping, Callable, Iterable, Generator
 from importlib.metadata import Distribution, PackageNotFoundError, distribution
 
 import click
 from nonebot.plugin import Plugin
 from nonebot.params import Depends
 from nonebot import logger, get_driver
+from sqlalchemy.sql.visitors import traverse
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.engine.default import StrCompileDialect
 from sqlalchemy.sql.selectable import ExecutableReturnsRows
 from nonebot.typing import origin_is_union, origin_is_literal
 
@@ -43,21 +49,28 @@ if TYPE_CHECKING:
 _T = TypeVar("_T")
 _P = ParamSpec("_P")
 
+# NOTE: `dataclass(slots=True)` is only available in Python 3.10+
+_SLOTS: dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
 
 DependsInner = type(Depends())
 
 
+# NOTE: downgrade log levels of third-party libraries by one
+_DOWNGRADED_LEVELS = {"DEBUG": "TRACE", "INFO": "DEBUG"}
+
+
 class LoguruHandler(logging.Handler):
     def emit(self, record: logging.LogRecord):
         try:
             level = logger.level(record.levelname).name
             if record.levelno <= logging.INFO:
-                level = {"DEBUG": "TRACE", "INFO": "DEBUG"}.get(level, level)
+                level = _DOWNGRADED_LEVELS.get(level, level)
         except ValueError:
             level = record.levelno
 
-        frame, depth = sys._getframe(6), 6
-        while frame and frame.f_code.co_filename == logging.__file__:
+        frame, depth, logging_file = sys._getframe(6), 6, logging.__file__
+        while frame and frame.f_code.co_filename == logging_file:
             frame = frame.f_back
             depth += 1
 
@@ -66,43 +79,108 @@ class LoguruHandler(logging.Handler):
         )
 
 
-class StreamToLogger(StringIO):
+class StreamToLogger(TextIOBase):
     """Use for startup migrate, AlembicConfig.print_stdout() only"""
 
     def __init__(self, level="INFO"):
+        super().__init__()
         self._level = level
 
+    def writable(self) -> bool:
+        return True
+
     def write(self, buffer: str):
+        # NOTE: skip blank writes (e.g. an empty `click.echo()`) before walking the stack
+        buffer = buffer.rstrip()
+        if not buffer:
+            return
+
         frame, depth = sys._getframe(3), 3
         while frame and frame.f_code.co_name != "print_stdout":
             frame = frame.f_back
             depth += 1
 
-        for line in buffer.rstrip().splitlines():
+        for line in buffer.splitlines():
             logger.opt(depth=depth + 1).log(self._level, line.rstrip())
 
     def flush(self):
         pass
 
 
-@dataclass(unsafe_hash=True)
+@dataclass(frozen=True, **_SLOTS)
 class Option:
     stream: bool = True
     scalars: bool = False
     result: methodcaller | None = None
     calls: tuple[methodcaller] = field(default_factory=tuple)
+    yield_per: int | None = None
+
+    _hash: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "_hash",
+            hash((self.stream, self.scalars, self.result, self.calls, self.yield_per)),
+        )
+
+    def __hash__(self) -> int:
+        return self._hash
+
+
+# NOTE: `compile()` without a bind creates a new dialect on every call,
+# share one as only the names of bind parameters are needed.
+_STR_COMPILE_DIALECT = StrCompileDialect()
+
+
+@lru_cache(maxsize=1024)
+def _compiled_params(statement: ExecutableReturnsRows) -> tuple[tuple[str, Any], ...]:
+    # NOTE: compiling is only needed to get the (anonymous) names of dependent bind
+    # parameters, skip it if there is none.
+    bindparams: set[BindParameter] = set()
+
+    def visit_bindparam(bindparam: BindParameter) -> None:
+        if isinstance(bindparam.value, DependsInner):
+            bindparams.add(bindparam)
 
+    traverse(statement, {}, {"bindparam": visit_bindparam})
+    if not bindparams:
+        return ()
 
-@dataclass
+    compiled = statement.compile(dialect=_STR_COMPILE_DIALECT)
+    return tuple(
+        {
+            name: bindparam.value
+            for bindparam, name in compiled.bind_names.items()
+            if bindparam in bindparams
+        }.items()
+    )
+
+
+@dataclass(**_SLOTS)
 class Dependency:
     __signature__: Signature = field(init=False)
 
     statement: ExecutableReturnsRows
     option: Option
 
+    _hash: int = field(init=False, repr=False, compare=False)
+    _execution_options: Mapping[str, Any] = field(init=False, repr=False, compare=False)
+
     def __post_init__(self) -> None:
         from . import async_scoped_session
 
+        self._hash = hash((self.statement, self.option))
+
+        # NOTE: options passed at call time take precedence over the statement's own,
+        # so `yield_per` of the option is only a default.
+        self._execution_options = (
+            {"yield_per": self.option.yield_per}
+            if self.option.yield_per
+            and "yield_per" not in self.statement.get_execution_options()
+            else {}
+        )
+
         self.__signature__ = Signature(
             [
                 Parameter(
@@ -110,15 +188,18 @@ class Dependency:
                 ),
                 *(
                     Parameter(name, Parameter.KEYWORD_ONLY, default=depends)
-                    for name, depends in self.statement.compile().params.items()
-                    if isinstance(depends, DependsInner)
+                    for name, depends in _compiled_params(self.statement)
                 ),
             ]
         )
 
     async def __call__(self, *, _session: async_scoped_session, **params: Any) -> Any:
         if self.option.stream:
-            result = await _session.stream(self.statement, params)
+            result = await _session.stream(
+                self.statement,
+                params,
+                execution_options=self._execution_options,
+            )
         else:
             result = await _session.execute(self.statement, params)
 
@@ -131,16 +212,28 @@ class Dependency:
         if call := self.option.result:
             result = call(result)
 
-            if self.option.stream:
+            # NOTE: `AsyncResult.partitions()` returns an async iterator
+            if self.option.stream and isawaitable(result):
                 result = await result
 
         return result
 
     def __hash__(self) -> int:
-        return hash((self.statement, self.option))
+        return self._hash
 
 
 def generic_issubclass(scls: Any, cls: Any) -> Any:
+    try:
+        hash((scls, cls))
+    except TypeError:
+        # NOTE: type annotation is unhashable
+        return _generic_issubclass.__wrapped__(scls, cls)
+
+    return _generic_issubclass(scls, cls)
+
+
+@lru_cache(maxsize=4096)
+def _generic_issubclass(scls: Any, cls: Any) -> Any:
     if cls is Any:
         return True
 
@@ -187,18 +280,31 @@ def generic_issubclass(scls: Any, cls: Any) -> Any:
     )
 
 
-def return_progressbar(func: Callable[_P, Iterable[_T]]) -> Callable[_P, Iterable[_T]]:
+@lru_cache(None)
+def get_log_level() -> int:
     log_level = get_driver().config.log_level
     if isinstance(log_level, str):
         log_level = logger.level(log_level).no
 
-    if log_level <= logger.level("INFO").no:
+    return log_level
+
+
+def return_progressbar(func: Callable[_P, Iterable[_T]]) -> Callable[_P, Iterable[_T]]:
+    if get_log_level() <= logger.level("INFO").no:
         return func
 
     @wraps(func)
     def wrapper(*args: _P.args, **kwargs: _P.kwargs) -> Iterable[_T]:
+        items = iter(func(*args, **kwargs))
+
+        # NOTE: skip the progressbar if there is nothing to run
+        for first in items:
+            break
+        else:
+            return
+
         with click.progressbar(
-            func(*args, **kwargs), label="运行迁移中", item_show_func=str
+            chain((first,), items), label="运行迁移中", item_show_func=str
         ) as bar:
             yield from bar
 
@@ -211,49 +317,102 @@ def get_parent_plugins(plugin: Plugin | None) -> Generator[Plugin, Any, None]:
         plugin = plugin.parent_plugin
 
 
-pkgs = packages_distributions()
+@lru_cache(None)
+def _packages_distributions() -> Mapping[str, list[str]]:
+    return packages_distributions()
 
 
-def is_editable(plugin: Plugin) -> bool:
-    *_, plugin = get_parent_plugins(plugin)
+@lru_cache(None)
+def _site_packages() -> frozenset[Path]:
+    def realpath(path: str) -> Path:
+        return Path(os.path.realpath(path))
 
-    path = files(plugin.module)
-    if not isinstance(path, Path) or "site-packages" in path.parts:
-        return False
+    paths = {sysconfig.get_path("purelib"), sysconfig.get_path("platlib")}
+    if site.ENABLE_USER_SITE:
+        paths.add(site.getusersitepackages())
+
+    # NOTE: `site.getsitepackages()` is missing in old virtualenvs, and also returns
+    # the bare prefix on Windows, which may contain the project itself.
+    prefixes = frozenset(
+        map(
+            realpath,
+            (sys.prefix, sys.exec_prefix, sys.base_prefix, sys.base_exec_prefix),
+        )
+    )
+    return frozenset(map(realpath, paths)).union(
+        path
+        for path in map(realpath, getattr(site, "getsitepackages", list)())
+        if path not in prefixes
+    )
 
-    dist: Distribution | None = None
 
+@lru_cache(None)
+def _distribution(name: str) -> Distribution | None:
     with suppress(PackageNotFoundError):
-        dist = distribution(plugin.name.replace("_", "-"))
+        return distribution(name)
 
-    if not dist and plugin.module.__file__:
-        path = Path(plugin.module.__file__)
-        for name in pkgs.get(plugin.module_name.split(".")[0], ()):
-            dist = distribution(name)
-            if path in (file.locate() for file in dist.files or ()):
-                break
-        else:
-            dist = None
 
-    if not dist:
-        return True
+@lru_cache(None)
+def _distribution_files(name: str) -> frozenset[Path]:
+    dist = cast(Distribution, _distribution(name))
+    return frozenset(Path(file.locate()) for file in dist.files or ())
+
+
+@lru_cache(None)
+def _is_editable_distribution(name: str) -> bool:
+    dist = cast(Distribution, _distribution(name))
 
     # https://github.com/pdm-project/pdm/blob/fee1e6bffd7de30315e2134e19f9a6f58e15867c/src/pdm/utils.py#L361-L374
     if getattr(dist, "link_file", None) is not None:
         return True
 
     direct_url = dist.read_text("direct_url.json")
-    if not direct_url:
+    if not direct_url or '"editable"' not in direct_url:
         return False
 
     direct_url_data = json.loads(direct_url)
     return direct_url_data.get("dir_info", {}).get("editable", False)
 
 
+@lru_cache(None)
+def is_editable(plugin: Plugin) -> bool:
+    *_, plugin = get_parent_plugins(plugin)
+
+    path = files(plugin.module)
+    if (
+        not isinstance(path, Path)
+        or "site-packages" in path.parts
+        or not _site_packages().isdisjoint(Path(os.path.realpath(path)).parents)
+    ):
+        return False
+
+    name = plugin.name.replace("_", "-")
+
+    if not _distribution(name):
+        if not plugin.module.__file__:
+            return True
+
+        path = Path(plugin.module.__file__)
+        for name in _packages_distributions().get(
+            plugin.module_name.partition(".")[0], ()
+        ):
+            if path in _distribution_files(name):
+                break
+        else:
+            return True
+
+    return _is_editable_distribution(name)
+
+
 def get_subclasses(cls: type[_T]) -> Generator[type[_T], None, None]:
-    yield from cls.__subclasses__()
-    for subclass in cls.__subclasses__():
-        yield from get_subclasses(subclass)
+    seen: set[type[_T]] = set()
+    stack = [cls]
+    while stack:
+        for subclass in stack.pop().__subclasses__():
+            if subclass not in seen:
+                seen.add(subclass)
+                yield subclass
+                stack.append(subclass)
 
 
 def coroutine(func: Callable[_P, _T]) -> Callable[_P, Coroutine[Any, Any, _T]]:
@@ -271,6 +430,11 @@ else:
     import types
     import functools
 
+    @functools.lru_cache(maxsize=4096)
+    def _compile_annotation(value: str) -> types.CodeType:
+        # NOTE: strip leading spaces and tabs, as `eval()` does for strings
+        return compile(value.lstrip(" \t"), "<string>", "eval")
+
     def get_annotations(obj, *, globals=None, locals=None, eval_str=False):
         # sourcery skip
         """Compute the annotations dict for an object.
@@ -381,8 +545,8 @@ else:
         if locals is None:
             locals = obj_locals
 
-        return_value = {
-            key: value if not isinstance(value, str) else eval(value, globals, locals)
-            for key, value in ann.items()
-        }
+        return_value = dict(ann)
+        for key, value in ann.items():
+            if isinstance(value, str):
+                return_value[key] = eval(_compile_annotation(value), globals, locals)
         return return_value